@@ -51,6 +51,12 @@ def shared_args(parser):
                         help='Batch size during training or testing.')
     parser.add_argument('--num_workers', default=0, type=int,
                         help='Number of data loading workers; -1 means automatic.')
+    parser.add_argument('--prefetch_factor', default=-1, type=int,
+                        help='Number of batches loaded in advance by each data loading worker; '
+                        '-1 means automatic.')
+    parser.add_argument('--pin_memory', default=True, type=_str2bool,
+                        help='Load batches into page-locked memory for faster, asynchronous '
+                        'transfers to the GPU. Disable if host memory is tight.')
 
     # Logging & checkpointing options.
     parser.add_argument('--checkpoint_root', default='checkpoints/', type=str,
@@ -148,6 +154,10 @@ def train_args():
                         help='Post-processed image vertical size.')
     parser.add_argument('--frame_width', default=320, type=int,
                         help='Post-processed image horizontal size.')
+    parser.add_argument('--data_mix_weights', default=[], type=float, nargs='*',
+                        help='If training on multiple data sources, relative probability of '
+                        'drawing every batch from each source type (e.g. kubric, ytvos), in order '
+                        'of first appearance in data_path. If empty, use equal ratios.')
     parser.add_argument('--augs_2d', default=True, type=_str2bool,
                         help='Apply random spatial flipping & cropping during train / val.')
     parser.add_argument('--augs_3d', default=True, type=_str2bool,
@@ -448,6 +458,10 @@ def verify_args(args, is_train=False):
             args.num_workers = 4
         args.num_workers = min(args.num_workers, 80)
     args.num_workers = int(args.num_workers)
+    if args.prefetch_factor < 0:
+        args.prefetch_factor = max(2 * args.batch_size // max(args.num_workers, 1), 2)
+    if args.device == 'cpu':
+        args.pin_memory = False  # Only useful for transfers to a GPU.
 
     # If we have no name (e.g. for smaller scripts in eval), assume we are not interested in logging
     # either.
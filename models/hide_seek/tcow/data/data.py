@@ -5,6 +5,9 @@ Created by Basile Van Hoorick, Jun 2022.
 
 from __init__ import *
 
+# Library imports.
+import re
+
 # Internal imports.
 import data_kubric
 import data_mixed
@@ -26,21 +29,46 @@ def _seed_worker(worker_id):
     torch.set_printoptions(precision=3, sci_mode=False)
 
 
-def _is_kubric_source(cur_data_path):
-    return ('kubcon' in cur_data_path.lower() or 'kubbench' in cur_data_path.lower())
+def _get_worker_kwargs(args, persistent=True):
+    '''
+    Returns DataLoader options that are only valid when there are worker processes. Keeping workers
+        alive avoids re-forking them (and copying dataset instances) at the start of every epoch.
+    '''
+    worker_kwargs = dict()
+    if args.num_workers > 0:
+        worker_kwargs['persistent_workers'] = persistent
+        worker_kwargs['prefetch_factor'] = args.prefetch_factor
+    return worker_kwargs
+
+
+def _get_batching_kwargs(args, batch_sampler, shuffle):
+    '''
+    Returns DataLoader batching options for training and validation. A batch sampler is mutually
+        exclusive with batch_size, shuffle, and drop_last, since it takes care of all of them.
+    '''
+    if batch_sampler is not None:
+        return dict(batch_sampler=batch_sampler)
+    else:
+        return dict(batch_size=args.batch_size, shuffle=shuffle, drop_last=True)
 
 
-def _is_ytvos_source(cur_data_path):
-    # NOTE: Avoid checking for ytvos here, since that is how I name plugin folders!
-    return ('youtube-vos' in cur_data_path.lower())
+# Patterns are checked in order of precedence, since some paths may match more than one.
+# NOTE: Avoid checking for ytvos here, since that is how I name plugin folders!
+_SOURCE_PATTERNS = [
+    ('kubric', re.compile(r'kubcon|kubbench', re.IGNORECASE)),
+    ('ytvos', re.compile(r'youtube-vos', re.IGNORECASE)),
+    ('plugin', re.compile(r'plugin|\.(?:mp4|avi|gif|webm)$', re.IGNORECASE)),
+]
 
 
-def _is_plugin_source(cur_data_path):
-    return ('plugin' in cur_data_path.lower() or
-            cur_data_path.lower().endswith('.mp4') or
-            cur_data_path.lower().endswith('.avi') or
-            cur_data_path.lower().endswith('.gif') or
-            cur_data_path.lower().endswith('.webm'))
+def _detect_source(cur_data_path):
+    '''
+    :return (str): kubric / ytvos / plugin, or None if the data path is not recognized.
+    '''
+    for (source_name, source_pattern) in _SOURCE_PATTERNS:
+        if source_pattern.search(cur_data_path):
+            return source_name
+    return None
 
 
 def create_train_val_data_loaders(args, logger):
@@ -57,7 +85,9 @@ def create_train_val_data_loaders(args, logger):
     shuffle = not(args.data_loop_only)
 
     for cur_data_path in actual_data_paths:
-        if _is_kubric_source(cur_data_path):
+        source_name = _detect_source(cur_data_path)
+
+        if source_name == 'kubric':
             (train_dataset, val_aug_dataset, val_noaug_dataset, dset_args) = \
                 create_kubric_train_val_data_loaders(args, logger, cur_data_path)
             train_dset_sources['kubric'] = train_dataset
@@ -65,27 +95,41 @@ def create_train_val_data_loaders(args, logger):
             val_noaug_dset_sources['kubric'] = val_noaug_dataset
             dset_args_sources['kubric'] = dset_args
 
-        elif _is_ytvos_source(cur_data_path):
+        elif source_name == 'ytvos':
             (train_dataset, dset_args) = \
                 create_youtube_vos_train_loader(args, logger, cur_data_path)
             train_dset_sources['ytvos'] = train_dataset
             dset_args_sources['ytvos'] = dset_args
 
-        elif _is_plugin_source(cur_data_path):
+        elif source_name == 'plugin':
             raise NotImplementedError('Plugin video is only available at test time.')
 
         else:
             raise ValueError('Unknown data path: {}'.format(cur_data_path))
 
+    # NOTE: Sources are keyed by type, so multiple data paths of one type count only once here.
+    if len(args.data_mix_weights) > 0 and len(args.data_mix_weights) != len(train_dset_sources):
+        raise ValueError(f'Got {len(args.data_mix_weights)} data_mix_weights, but data_path '
+                         f'resolves to {len(train_dset_sources)} source types: '
+                         f'{list(train_dset_sources.keys())}')
+
+    # NOTE: Mixed-batch loaders sample from a ConcatDataset with a SourceBatchSampler, which ensures
+    # that every batch still contains examples from one source only.
+    train_batch_sampler = None
+    val_aug_batch_sampler = None
+    val_noaug_batch_sampler = None
+
     if len(train_dset_sources) == 1:
         # No mixed-batch training; variables already correctly assigned.
         final_train_dataset = train_dataset
 
     elif len(train_dset_sources) > 1:
-        # Configure mixed-batch training with equal ratios.
-        final_train_dataset = data_mixed.MixedDataset(logger, train_dset_sources,
-                                                        chunk_size=args.batch_size)
-        shuffle = False
+        # Configure mixed-batch training with equal or desired ratios.
+        mix_weights = args.data_mix_weights if len(args.data_mix_weights) > 0 else None
+        final_train_dataset = torch.utils.data.ConcatDataset(list(train_dset_sources.values()))
+        train_batch_sampler = data_mixed.SourceBatchSampler(
+            [len(x) for x in train_dset_sources.values()], args.batch_size,
+            weights=mix_weights, shuffle=shuffle)
 
     else:
         raise RuntimeError('No training datasets were successfully instantiated.')
@@ -97,28 +141,37 @@ def create_train_val_data_loaders(args, logger):
 
     elif len(val_aug_dset_sources) > 1:
         # Configure mixed-batch validation with equal ratios.
-        final_val_aug_dataset = data_mixed.MixedDataset(logger, val_aug_dset_sources,
-                                                          chunk_size=args.batch_size) \
-            if args.do_val_aug else None
-        final_val_noaug_dataset = data_mixed.MixedDataset(logger, val_noaug_dset_sources,
-                                                            chunk_size=args.batch_size) \
-            if args.do_val_noaug else None
-        shuffle = False
+        if args.do_val_aug:
+            final_val_aug_dataset = torch.utils.data.ConcatDataset(
+                list(val_aug_dset_sources.values()))
+            val_aug_batch_sampler = data_mixed.SourceBatchSampler(
+                [len(x) for x in val_aug_dset_sources.values()], args.batch_size,
+                shuffle=shuffle)
+        if args.do_val_noaug:
+            final_val_noaug_dataset = torch.utils.data.ConcatDataset(
+                list(val_noaug_dset_sources.values()))
+            val_noaug_batch_sampler = data_mixed.SourceBatchSampler(
+                [len(x) for x in val_noaug_dset_sources.values()], args.batch_size,
+                shuffle=shuffle)
 
     elif args.do_val_aug or args.do_val_noaug:
         logger.error('No validation datasets were successfully instantiated.')
 
+    # NOTE: Only the train loader keeps its workers alive, since persistent pools for the validation
+    # loaders as well would triple the number of worker processes (and dataset copies) in memory.
     train_loader = torch.utils.data.DataLoader(
-        final_train_dataset, batch_size=args.batch_size, num_workers=args.num_workers,
-        shuffle=shuffle, worker_init_fn=_seed_worker, drop_last=True, pin_memory=False)
+        final_train_dataset, num_workers=args.num_workers, worker_init_fn=_seed_worker,
+        pin_memory=args.pin_memory, **_get_batching_kwargs(args, train_batch_sampler, shuffle),
+        **_get_worker_kwargs(args, persistent=True))
+    worker_kwargs = _get_worker_kwargs(args, persistent=False)
     val_aug_loader = torch.utils.data.DataLoader(
-        final_val_aug_dataset, batch_size=args.batch_size, num_workers=args.num_workers,
-        shuffle=shuffle, worker_init_fn=_seed_worker, drop_last=True, pin_memory=False) \
-        if args.do_val_aug else None
+        final_val_aug_dataset, num_workers=args.num_workers, worker_init_fn=_seed_worker,
+        pin_memory=args.pin_memory, **_get_batching_kwargs(args, val_aug_batch_sampler, shuffle),
+        **worker_kwargs) if args.do_val_aug else None
     val_noaug_loader = torch.utils.data.DataLoader(
-        final_val_noaug_dataset, batch_size=args.batch_size, num_workers=args.num_workers,
-        shuffle=shuffle, worker_init_fn=_seed_worker, drop_last=True, pin_memory=False) \
-        if args.do_val_noaug else None
+        final_val_noaug_dataset, num_workers=args.num_workers, worker_init_fn=_seed_worker,
+        pin_memory=args.pin_memory, **_get_batching_kwargs(args, val_noaug_batch_sampler, shuffle),
+        **worker_kwargs) if args.do_val_noaug else None
 
     return (train_loader, val_aug_loader, val_noaug_loader, dset_args_sources)
 
@@ -199,8 +252,8 @@ def create_test_data_loader(train_args, test_args, train_dset_args_sources, logg
     actual_data_paths = test_args.data_path
     assert isinstance(actual_data_paths, list)
     
-    # Due to the nature of testing, we will simply use ConcatDataset instead of MixedDataset here
-    # when there are multiple data sources.
+    # Due to the nature of testing, we will simply use ConcatDataset without SourceBatchSampler
+    # here when there are multiple data sources.
     test_dataset_list = []
     # NOTE: Only the last test_dset_args of each source in the list is remembered and returned.
     test_dset_args_sources = dict()
@@ -211,21 +264,23 @@ def create_test_data_loader(train_args, test_args, train_dset_args_sources, logg
         if not('kubric' in train_dset_args_sources.keys()):
             train_dset_args_sources = {'kubric': train_dset_args_sources}
         
-        if _is_kubric_source(cur_data_path):
+        source_name = _detect_source(cur_data_path)
+
+        if source_name == 'kubric':
             (test_dataset, test_dset_args) = \
                 create_kubric_test_data_loader(
                     train_args, test_args, train_dset_args_sources, logger, cur_data_path)
             test_dataset_list.append(test_dataset)
             test_dset_args_sources['kubric'] = test_dset_args
 
-        elif _is_ytvos_source(cur_data_path):
+        elif source_name == 'ytvos':
             (test_dataset, test_dset_args) = \
                 create_youtube_vos_test_loader(
                     train_args, test_args, train_dset_args_sources, logger, cur_data_path)
             test_dataset_list.append(test_dataset)
             test_dset_args_sources['ytvos'] = test_dset_args
 
-        elif _is_plugin_source(cur_data_path):
+        elif source_name == 'plugin':
             (test_dataset, test_dset_args) = \
                 create_plugin_test_data_loader(
                     train_args, test_args, train_dset_args_sources, logger, cur_data_path)
@@ -241,17 +296,22 @@ def create_test_data_loader(train_args, test_args, train_dset_args_sources, logg
         logger.info('Concatenating {} test datasets'.format(len(test_dataset_list)))
         final_test_dataset = torch.utils.data.ConcatDataset(test_dataset_list)
 
+    # NOTE: Test loaders are iterated only once (and test.py creates many of them in sequence), so
+    # persistent workers would only hold on to memory here.
     shuffle = False
+    worker_kwargs = _get_worker_kwargs(test_args, persistent=False)
     test_loader = torch.utils.data.DataLoader(
         final_test_dataset, batch_size=test_args.batch_size, num_workers=test_args.num_workers,
-        shuffle=shuffle, worker_init_fn=_seed_worker, drop_last=False, pin_memory=False)
+        shuffle=shuffle, worker_init_fn=_seed_worker, drop_last=False,
+        pin_memory=test_args.pin_memory, **worker_kwargs)
 
     return (test_loader, test_dset_args_sources)
 
 
 def create_kubric_test_data_loader(train_args, test_args, train_dset_args_sources, logger,
                                    cur_data_path):
-    test_dset_args = copy.deepcopy(train_dset_args_sources['kubric'])
+    # NOTE: A shallow copy suffices, since all values are scalars and only keys are reassigned.
+    test_dset_args = dict(train_dset_args_sources['kubric'])
     
     # Fix outdated arguments from older checkpoints.
     if 'augs_version' not in test_dset_args:
@@ -286,7 +346,7 @@ def create_kubric_test_data_loader(train_args, test_args, train_dset_args_source
 
 def create_youtube_vos_test_loader(train_args, test_args, train_dset_args_sources, logger,
                                    cur_data_path):
-    test_dset_args = copy.deepcopy(train_dset_args_sources['ytvos'])
+    test_dset_args = dict(train_dset_args_sources['ytvos'])
     
     # Fix outdated arguments from older checkpoints.
     if 'augs_version' not in test_dset_args:
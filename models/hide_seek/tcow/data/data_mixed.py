@@ -88,3 +88,68 @@ class MixedDataset(torch.utils.data.Dataset):
         self.logger.debug(f'mixed_info: {mixed_info}')
 
         return data_retval
+
+
+class SourceBatchSampler(torch.utils.data.Sampler):
+    '''
+    Yields batches of indices into a ConcatDataset of multiple sources, such that every batch is
+        drawn from one source only, while the source of each batch is sampled with configurable
+        probabilities. This replaces MixedDataset for training, such that we retain shuffling.
+    '''
+
+    def __init__(self, source_sizes, batch_size, weights=None, shuffle=True):
+        '''
+        source_sizes (list of int): Number of examples per source, in ConcatDataset order.
+        batch_size (int): Number of examples per batch; incomplete batches are never returned.
+        weights (list of float): Relative probability of drawing a batch from each source. If None,
+            all sources are equally likely.
+        shuffle (bool): If False, sources are visited in turns and examples in order instead.
+        '''
+        self.source_sizes = list(source_sizes)
+        assert min(self.source_sizes) > 0, \
+            f'Every data source must contain at least one example, got sizes {self.source_sizes}.'
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.num_sources = len(self.source_sizes)
+        self.source_offsets = np.concatenate([[0], np.cumsum(self.source_sizes)[:-1]])
+
+        if weights is None:
+            weights = np.ones(self.num_sources)
+        assert len(weights) == self.num_sources
+        self.weights = np.array(weights, dtype=np.float64) / np.sum(weights)
+
+        # Similar to MixedDataset with size_mode = max, one epoch corresponds to the largest source.
+        self.num_batches = int(max(self.source_sizes)) // self.batch_size
+
+    def __len__(self):
+        return self.num_batches
+
+    def _next_within_inds(self, src_idx, orders, cursors):
+        '''
+        Returns the next batch of indices within one source, and wraps around (with a fresh
+            permutation if shuffling) once that source runs out of examples.
+        '''
+        within_inds = []
+        while len(within_inds) < self.batch_size:
+            if orders[src_idx] is None or cursors[src_idx] >= self.source_sizes[src_idx]:
+                orders[src_idx] = np.random.permutation(self.source_sizes[src_idx]) \
+                    if self.shuffle else np.arange(self.source_sizes[src_idx])
+                cursors[src_idx] = 0
+            take = min(self.batch_size - len(within_inds),
+                       self.source_sizes[src_idx] - cursors[src_idx])
+            within_inds.extend(orders[src_idx][cursors[src_idx]:cursors[src_idx] + take])
+            cursors[src_idx] += take
+        return within_inds
+
+    def __iter__(self):
+        orders = [None] * self.num_sources
+        cursors = [0] * self.num_sources
+
+        if self.shuffle:
+            src_inds = np.random.choice(self.num_sources, size=self.num_batches, p=self.weights)
+        else:
+            src_inds = np.arange(self.num_batches) % self.num_sources
+
+        for src_idx in src_inds:
+            within_inds = self._next_within_inds(src_idx, orders, cursors)
+            yield [int(self.source_offsets[src_idx] + x) for x in within_inds]
@@ -12,8 +12,11 @@ sys.path.insert(0, os.getcwd())
 from __init__ import *
 
 # Library imports.
+import concurrent.futures
 import glob
 import json
+import re
+import threading
 import warnings
 
 # Internal imports.
@@ -43,6 +46,16 @@ def get_args():
     parser.add_argument('--no_video_copy_for', default=['kubcon'], type=str,
                         help='Guide file name subsets for which to just calculate averages, but '
                         'skip video copying.')
+    parser.add_argument('--link_videos', default=False, type=args._str2bool,
+                        help='Create hard links instead of copies of representative videos. This '
+                        'is nearly instant, but the links share contents with the originals.')
+    parser.add_argument('--num_threads', default=8, type=int,
+                        help='Number of test result folders to process concurrently. This also '
+                        'bounds the number of results tables held in memory at once.')
+    parser.add_argument('--num_procs', default=0, type=int,
+                        help='If > 0, number of test result folders to process in parallel with '
+                        'separate processes instead of threads, which helps when metric '
+                        'calculation is the bottleneck.')
     parser.add_argument('--write_summary', default=True, type=args._str2bool,
                         help='Gather CSV table of (model, guide, metric) values and export to '
                              'same output directory.')
@@ -57,6 +70,13 @@ def main(my_args, logger):
     for dp in my_args.testres_path:
         dps = glob.glob(dp)  # Parses wildcards and turns them into available matching folders.
         actual_testres_paths += dps
+    # NOTE: Overlapping patterns (or differently spelled paths) may yield the same folder twice,
+    # which must not be processed by two workers at once, so we remove duplicates by their
+    # resolved location while preserving order.
+    unique_testres_paths = dict()
+    for dp in actual_testres_paths:
+        unique_testres_paths.setdefault(os.path.realpath(dp), dp)
+    actual_testres_paths = list(unique_testres_paths.values())
     logger.info(f'Found {len(actual_testres_paths)} test result folders: '
                 f'{[str(pathlib.Path(x).name) for x in actual_testres_paths]}')
 
@@ -73,12 +93,13 @@ def main(my_args, logger):
         for line in notes_lines:
             (testres_pat, cur_note) = line.split('=')[:2]
             model_notes[testres_pat.strip()] = cur_note.strip()
+    note_cache = dict()
 
     summary = construct_summary(
-        my_args, actual_guide_paths, actual_testres_paths, model_notes)
+        my_args, actual_guide_paths, actual_testres_paths, model_notes, note_cache)
 
     summary = merge_cross_dataset_guides(
-        my_args, summary, actual_guide_paths, actual_testres_paths, model_notes)
+        my_args, summary, actual_guide_paths, actual_testres_paths, model_notes, note_cache)
 
     # Export summary.
     if my_args.write_summary:
@@ -89,145 +110,366 @@ def main(my_args, logger):
             summary_fp = os.path.join(my_args.output_dir, f'_autosmr_{summary_idx}.csv')
 
         # summary = summary.sort_index(axis=1)  # Sort horizontally by column name.
-        summary.to_csv(summary_fp)
+        # NOTE: The index of the summary is just a meaningless row counter.
+        summary.to_csv(summary_fp, index=False, lineterminator='\n')
 
     logger.info('Done!')
 
 
-def construct_summary(
-        my_args, actual_guide_paths, actual_testres_paths, model_notes):
+def fast_copy(src_fp, dst_fp, allow_link=False):
+    '''
+    Copies a (typically large video) file while avoiding userspace buffers where possible.
+        If allow_link, a hard link is attempted first. Otherwise, os.copy_file_range copies within
+        the kernel, which becomes a cheap reflink on supporting filesystems (e.g. XFS, Btrfs).
+        Falls back to shutil.copyfileobj if neither is available or the copy ends up incomplete.
+        An existing destination is never truncated, since it may be a hard link to a video in
+        another test result folder; instead, a complete temporary copy is moved over it.
+    '''
+    if allow_link:
+        try:
+            os.link(src_fp, dst_fp)
+            return
+        except FileExistsError:
+            return  # Another worker already put this video in place.
+        except OSError:
+            pass
+
+    # NOTE: The temporary file name is unique per process and thread, and does not end with any
+    # video suffix, such that concurrent workers never see or clobber each other's partial copies.
+    tmp_fp = f'{dst_fp}.{os.getpid()}_{threading.get_ident()}.tmp'
+    try:
+        with open(src_fp, 'rb') as src_f, open(tmp_fp, 'xb') as tmp_f:
+            remaining = os.fstat(src_f.fileno()).st_size
+            if hasattr(os, 'copy_file_range'):
+                try:
+                    while remaining > 0:
+                        copied = os.copy_file_range(src_f.fileno(), tmp_f.fileno(), remaining)
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                except OSError:
+                    pass  # For example, cross-device copies on older kernels.
+
+            # NOTE: Some filesystems (e.g. FUSE, NFS) silently copy nothing, so we only trust the
+            # kernel copy if the whole file arrived, and otherwise start over in userspace.
+            if remaining > 0:
+                src_f.seek(0)
+                tmp_f.seek(0)
+                tmp_f.truncate()
+                shutil.copyfileobj(src_f, tmp_f)
+
+        os.replace(tmp_fp, dst_fp)
+
+    finally:
+        if os.path.exists(tmp_fp):
+            os.remove(tmp_fp)
+
+
+def lookup_model_note(model_notes, note_cache, name):
+    '''
+    :return (str): Note of the first pattern in model_notes that occurs in name, or ' ' if none.
+        Results are memoized in note_cache, since the same names recur for every guide.
+    '''
+    if name not in note_cache:
+        cur_note = ' '
+        for testres_pat in model_notes.keys():
+            if testres_pat in name:
+                cur_note = model_notes[testres_pat]
+                break
+        note_cache[name] = cur_note
+    return note_cache[name]
+
+
+def read_itemized_csv(src_csv_fp):
+    '''
+    Parses test results with the multi-threaded PyArrow engine if it is installed. The first
+        (unnamed) column is the index that was exported along with the results.
+    '''
+    try:
+        csv = pd.read_csv(src_csv_fp, index_col=0, engine='pyarrow')
+    except ImportError:
+        csv = pd.read_csv(src_csv_fp, index_col=0, memory_map=True)
+    return csv
+
+
+def get_name_concats(csv):
+    '''
+    Joins all unique names per relevant column into one newline-separated string, such that we
+        can quickly test whether a pattern occurs anywhere in that column with a single str search.
+    :return (friendly_concat, scene_concat) tuple of str; scene_concat is None if absent.
+    '''
+    friendly_concat = '\n'.join(csv['friendly_short_name'].dropna().astype(str).unique())
+    scene_concat = '\n'.join(csv['scene_dn'].dropna().astype(str).unique()) \
+        if 'scene_dn' in csv.columns else None
+    return (friendly_concat, scene_concat)
+
+
+def guide_may_match(lines, friendly_concat, scene_concat):
+    '''
+    :return (bool): False only if no guide entry can match any row; see get_guide_mask().
+    '''
+    for cand_rep in lines:
+        if ',' in cand_rep and scene_concat is not None:
+            (cand_scene, cand_friendly) = cand_rep.split(',')[0:2]
+            if cand_scene in scene_concat and cand_friendly in friendly_concat:
+                return True
+        elif cand_rep in friendly_concat:
+            return True
+    return False
+
+
+def get_guide_mask(csv, lines):
+    '''
+    Marks all rows that match at least one guide entry, while scanning every column only once
+        per unique pattern group instead of once per entry.
+    :param csv (pd.df): Itemized test results.
+    :param lines (list of str): Guide entries, optionally of the form scene_pat,friendly_pat.
+    :return (np.array) of bool: Selection mask over rows.
+    '''
+    friendly_col = csv['friendly_short_name']
+    has_scene = ('scene_dn' in csv.columns)
+    masks = []
+
+    # Entries without scene pattern are merged into a single alternation over friendly names.
+    plain_lines = [x for x in lines if not(',' in x and has_scene)]
+    if len(plain_lines) > 0:
+        plain_pat = '|'.join([re.escape(x) for x in plain_lines])
+        masks.append(friendly_col.str.contains(plain_pat, na=False).to_numpy())
+
+    # Entries with scene pattern are grouped such that every unique scene is scanned only once.
+    scene_to_friendly = defaultdict(list)
+    for cand_rep in lines:
+        if ',' in cand_rep and has_scene:
+            (cand_scene, cand_friendly) = cand_rep.split(',')[0:2]
+            scene_to_friendly[cand_scene].append(cand_friendly)
+
+    for (cand_scene, cand_friendlies) in scene_to_friendly.items():
+        cur_mask = csv['scene_dn'].str.contains(re.escape(cand_scene), na=False).to_numpy()
+        # An empty friendly pattern means that every row within this scene matches.
+        if all([len(x) > 0 for x in cand_friendlies]):
+            friendly_pat = '|'.join([re.escape(x) for x in cand_friendlies])
+            cur_mask = cur_mask & friendly_col.str.contains(friendly_pat, na=False).to_numpy()
+        masks.append(cur_mask)
+
+    agg_mask = np.logical_or.reduce(masks)
+    return agg_mask
+
+
+def process_testres(my_args, src_dp, guides, model_notes, note_cache):
+    '''
+    Applies all guides to one test result folder.
+    :param guides (list of (guide_name, lines) tuples).
+    :return (list): Summary row (or None if nothing matched) for every guide.
+    '''
+    src_csv_fp = os.path.join(src_dp, 'itemized_results.csv')
+    if not os.path.exists(src_csv_fp):
+        logger.warning('CSV file not found: %s! Skipping...', src_csv_fp)
+        return [None] * len(guides)
+
+    # NOTE: Every guide revisits the same test results, so we parse the CSV only once, and keep it
+    # alive only while this folder is being processed.
+    csv = read_itemized_csv(src_csv_fp)
+    name_concats = get_name_concats(csv)
+    vis_fns_cache = dict()
+
+    summary_rows = [process_testres_guide(
+        my_args, src_dp, guide_name, lines, model_notes, note_cache, csv, name_concats,
+        vis_fns_cache) for (guide_name, lines) in guides]
+
+    return summary_rows
+
+
+def process_testres_group(my_args, src_dps, guides, model_notes, note_cache):
+    '''
+    Processes test result folders that share the same output folders one after another.
+    :return (list): Result of process_testres() for every test result folder.
+    '''
+    return [process_testres(my_args, src_dp, guides, model_notes, note_cache)
+            for src_dp in src_dps]
+
+
+def process_testres_guide(my_args, src_dp, guide_name, lines, model_notes, note_cache, csv,
+                          name_concats, vis_fns_cache):
+    '''
+    Filters one test result folder according to one guide, exports the selected results and
+        videos, and returns the corresponding summary row (or None if nothing matched).
+    '''
+    # Filter & export numerical results.
+    # Cheaply skip guides that cannot possibly match any row before building the actual mask.
+    if not guide_may_match(lines, *name_concats):
+        return None
+
+    agg_mask = get_guide_mask(csv, lines)
+
+    sel_csv = csv[agg_mask]
+    num_examples = len(sel_csv)
+
+    if num_examples == 0:
+        # logger.warning(f'No representative results found in {src_csv_fp}! Skipping...')
+        return None
+
+    src_dn = str(pathlib.Path(src_dp).name)
+    dst_dn = src_dn + '_ar_' + guide_name
+    dst_dp = os.path.join(my_args.output_dir, dst_dn)
+    os.makedirs(dst_dp, exist_ok=True)
+    dst_csv_fp = os.path.join(dst_dp, f'z_filt_item_res_{guide_name}.csv')
+    if os.path.exists(dst_csv_fp):
+        os.remove(dst_csv_fp)
+    # NOTE: We keep the index, since it refers to the original row in itemized_results.csv.
+    sel_csv.to_csv(dst_csv_fp, lineterminator='\n', chunksize=10000)
+
+    # Calculate and neatly summarize aggregate statistics for this (test, guide) pair.
+    final_weighted_metrics = metrics.calculate_weighted_averages_dataframe(sel_csv)
+    final_unweighted_metrics = metrics.calculate_unweighted_averages_dataframe(sel_csv)
+
+    # Filter to ensure positive counts only.
+    final_weighted_metrics = {k: v for (k, v) in sorted(final_weighted_metrics.items())
+                              if ('count' in k and v > 0) or ('mean' in k and v > -1.0)}
+    final_unweighted_metrics = {k: v for (k, v) in sorted(final_unweighted_metrics.items())
+                                if ('count' in k and v > 0) or ('mean' in k and v > -1.0)}
+
+    with open(os.path.join(dst_dp, f'z_metrics_{guide_name}.txt'), 'w') as f:
+        f.writelines(f'Logs: {src_dn}\n')
+        f.writelines(f'Guide: {guide_name}\n')
+        f.writelines(f'Selected number of examples: {num_examples}\n')
+        f.writelines('\nWeighted:\n')
+        f.writelines([f'{k}: {v:}\n'
+                      for (k, v) in sorted(final_weighted_metrics.items())])
+        f.writelines('\nUnweighted:\n')
+        f.writelines([f'{k}: {v:}\n'
+                      for (k, v) in sorted(final_unweighted_metrics.items())])
+
+    # Copy representative videos corresponding to selected rows.
+    if any([x in guide_name.lower() for x in my_args.no_video_copy_for]):
+        logger.info('Skipping video copy...')
+
+    else:
+        logger.info('Copying videos matching desired suffices...')
+
+        # List visuals only once per test result folder, instead of globbing it for every
+        # (guide, row, suffix) triplet. Hidden files are excluded to remain consistent with glob.
+        src_vis_dp = os.path.join(src_dp, 'visuals')
+        if src_vis_dp not in vis_fns_cache:
+            vis_fns_cache[src_vis_dp] = [x.name for x in os.scandir(src_vis_dp)
+                                         if not x.name.startswith('.')] \
+                if os.path.isdir(src_vis_dp) else []
+        vis_fns = vis_fns_cache[src_vis_dp]
+        suffix_vis_fns = {suffix: [x for x in vis_fns if x.endswith(suffix)]
+                          for suffix in my_args.video_suffix}
+
+        # Equivalent to glob pattern: *friendly_short_name*suffix.
+        src_vid_fps = set()
+        for friendly_short_name in sel_csv['friendly_short_name'].tolist():
+            for suffix in my_args.video_suffix:
+                src_vid_fps.update([os.path.join(src_vis_dp, x) for x in suffix_vis_fns[suffix]
+                                    if friendly_short_name in x[:len(x) - len(suffix)]])
+
+        for src_vid_fp in sorted(src_vid_fps):
+            src_vid_fn = str(pathlib.Path(src_vid_fp).name)
+            dst_vid_fp = os.path.join(dst_dp, src_vid_fn)
+            if not(os.path.exists(dst_vid_fp)):
+                fast_copy(src_vid_fp, dst_vid_fp, my_args.link_videos)
+
+    # Attach custom note if found.
+    note_dict = {'notes': lookup_model_note(model_notes, note_cache, src_dn)}
+
+    # To avoid confusing cross-dataset aggregations with perfect baselines, we put the
+    # baseline type in front of the shorthand test result name.
+    fixed_dn = src_dn
+    if '_pb' in src_dn:
+        fixed_dn = 'test_pb' + src_dn.split('_pb')[-1] + '_' + src_dn.split('_')[2]
+
+    # Return summary row.
+    summary_row = {
+        'guide': guide_name,
+        'testres_dn': fixed_dn,
+        **note_dict,
+        'num_examples': num_examples,
+        **{'weighted_' + k: v for (k, v) in final_weighted_metrics.items()},
+        **{'unweighted_' + k: v for (k, v) in final_unweighted_metrics.items()},
+    }
+
+    logger.info('Subselected %d entries for: %s', num_examples, src_dn)
+
+    return summary_row
 
-    summary = pd.DataFrame()
 
-    for cur_guide_fp in tqdm.tqdm(actual_guide_paths):
+def construct_summary(
+        my_args, actual_guide_paths, actual_testres_paths, model_notes, note_cache):
 
-        # NOTE: Entries in guide refer to part of friendly_short_name (AND also scene_dn if two
-        # comma-separated patterns are specified)!
+    # NOTE: Entries in guide refer to part of friendly_short_name (AND also scene_dn if two
+    # comma-separated patterns are specified)!
+    guides = []
+    for cur_guide_fp in actual_guide_paths:
         guide_name = str(pathlib.Path(cur_guide_fp).name).split('.')[0]
-        logger.info(f'Processing guide {cur_guide_fp}...')
+        logger.info('Reading guide %s...', cur_guide_fp)
 
         lines = sorted(my_utils.read_txt_strip_comments(cur_guide_fp))
         if len(lines) == 0:
-            logger.warning(f'Guide {guide_name} seems empty? Skipping...')
+            logger.warning('Guide %s seems empty? Skipping...', guide_name)
             continue
+        guides.append((guide_name, lines))
 
-        for src_dp in tqdm.tqdm(actual_testres_paths):
-
-            src_csv_fp = os.path.join(src_dp, 'itemized_results.csv')
-            if not os.path.exists(src_csv_fp):
-                logger.warning(f'CSV file not found: {src_csv_fp}! Skipping...')
-                continue
-
-            # Filter & export numerical results.
-            csv = pd.read_csv(src_csv_fp)
-            csv.drop(columns=csv.columns[0])  # Remove unnamed index.
-            agg_mask = csv['friendly_short_name'].str.contains(lines[0])
-
-            for cand_rep in lines[0:]:
-                if ',' in cand_rep and 'scene_dn' in csv.columns:
-                    cand_scene = cand_rep.split(',')[0]
-                    cand_friendly = cand_rep.split(',')[1]
-                    cur_mask = csv['scene_dn'].str.contains(cand_scene)
-                    if len(cand_friendly) > 0:
-                        cur_mask = cur_mask & csv['friendly_short_name'].str.contains(cand_friendly)
-                else:
-                    cur_mask = csv['friendly_short_name'].str.contains(cand_rep)
-
-                agg_mask = agg_mask | cur_mask
-
-            sel_csv = csv[agg_mask]
-            num_examples = len(sel_csv)
-
-            if num_examples == 0:
-                # logger.warning(f'No representative results found in {src_csv_fp}! Skipping...')
-                continue
-
-            src_dn = str(pathlib.Path(src_dp).name)
-            dst_dn = src_dn + '_ar_' + guide_name
-            dst_dp = os.path.join(my_args.output_dir, dst_dn)
-            os.makedirs(dst_dp, exist_ok=True)
-            dst_csv_fp = os.path.join(dst_dp, f'z_filt_item_res_{guide_name}.csv')
-            if os.path.exists(dst_csv_fp):
-                os.remove(dst_csv_fp)
-            sel_csv.to_csv(dst_csv_fp)
-
-            # Calculate and neatly summarize aggregate statistics for this (test, guide) pair.
-            final_weighted_metrics = metrics.calculate_weighted_averages_dataframe(sel_csv)
-            final_unweighted_metrics = metrics.calculate_unweighted_averages_dataframe(sel_csv)
+    # NOTE: Messages in this method are formatted lazily by the logger, and progress bars are
+    # hidden when output is redirected (e.g. in SLURM jobs), since they would only clutter the logs.
+    hide_progress = not(sys.stderr.isatty())
 
-            # Filter to ensure positive counts only.
-            final_weighted_metrics = {k: v for (k, v) in sorted(final_weighted_metrics.items())
-                                      if ('count' in k and v > 0) or ('mean' in k and v > -1.0)}
-            final_unweighted_metrics = {k: v for (k, v) in sorted(final_unweighted_metrics.items())
-                                        if ('count' in k and v > 0) or ('mean' in k and v > -1.0)}
-
-            with open(os.path.join(dst_dp, f'z_metrics_{guide_name}.txt'), 'w') as f:
-                f.writelines(f'Logs: {src_dn}\n')
-                f.writelines(f'Guide: {guide_name}\n')
-                f.writelines(f'Selected number of examples: {num_examples}\n')
-                f.writelines('\nWeighted:\n')
-                f.writelines([f'{k}: {v:}\n'
-                              for (k, v) in sorted(final_weighted_metrics.items())])
-                f.writelines('\nUnweighted:\n')
-                f.writelines([f'{k}: {v:}\n'
-                              for (k, v) in sorted(final_unweighted_metrics.items())])
-
-            # Copy representative videos corresponding to selected rows.
-            if any([x in guide_name.lower() for x in my_args.no_video_copy_for]):
-                logger.info('Skipping video copy...')
-
-            else:
-                logger.info('Copying videos matching desired suffices...')
-                src_vid_fps = []
-                for idx, row in sel_csv.iterrows():
-                    for suffix in my_args.video_suffix:
-                        matches = glob.glob(os.path.join(
-                            src_dp, 'visuals', '*' + row['friendly_short_name'] + '*' + suffix))
-                        src_vid_fps += matches
-
-                src_vid_fps = sorted(list(set(src_vid_fps)))
-                for src_vid_fp in src_vid_fps:
-                    src_vid_fn = str(pathlib.Path(src_vid_fp).name)
-                    dst_vid_fp = os.path.join(dst_dp, src_vid_fn)
-                    if not(os.path.exists(dst_vid_fp)):
-                        shutil.copyfile(src_vid_fp, dst_vid_fp)
-
-            # Attach custom note if found.
-            note_dict = {'notes': ' '}
-            for testres_pat in model_notes.keys():
-                if testres_pat in src_dn:
-                    note_dict = {'notes': model_notes[testres_pat]}
-                    break
-
-            # To avoid confusing cross-dataset aggregations with perfect baselines, we put the
-            # baseline type in front of the shorthand test result name.
-            fixed_dn = src_dn
-            if '_pb' in src_dn:
-                fixed_dn = 'test_pb' + src_dn.split('_pb')[-1] + '_' + src_dn.split('_')[2]
-
-            # Update summary.
-            summary = summary.append({
-                'guide': guide_name,
-                'testres_dn': fixed_dn,
-                **note_dict,
-                'num_examples': num_examples,
-                **{'weighted_' + k: v for (k, v) in final_weighted_metrics.items()},
-                **{'unweighted_' + k: v for (k, v) in final_unweighted_metrics.items()},
-            }, ignore_index=True)
-
-            logger.info(f'Subselected {num_examples} entries for: {src_dn}')
-
-        logger.info()
+    # NOTE: Output folders are named after the test result folder only, so folders with the same
+    # name (e.g. from different log roots) would race on the same files if processed concurrently.
+    # Instead, they are handled in sequence by one worker, such that later ones simply overwrite.
+    testres_groups = defaultdict(list)
+    for src_dp in actual_testres_paths:
+        testres_groups[str(pathlib.Path(src_dp).name)].append(src_dp)
+    testres_groups = list(testres_groups.values())
+    for src_dps in testres_groups:
+        if len(src_dps) > 1:
+            logger.warning('Test result folders %s share the same name, so their exported results '
+                           'will overwrite each other!', src_dps)
+
+    # Every group of test result folders is handled independently, and only as many CSVs as there
+    # are workers are held in memory at once. NOTE: map() preserves the order of summary rows.
+    if my_args.num_procs > 0 and len(testres_groups) > 1:
+        # When metric calculation rather than I/O is the bottleneck, handle every test result
+        # folder in its own process. Forking avoids re-importing all libraries.
+        num_procs = min(my_args.num_procs, len(testres_groups))
+        with mp.get_context('fork').Pool(num_procs, maxtasksperchild=1) as pool:
+            group_rows = pool.starmap(process_testres_group, [
+                (my_args, src_dps, guides, model_notes, note_cache)
+                for src_dps in testres_groups])
+
+    else:
+        # The work is mostly I/O bound, so we overlap it across threads.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=my_args.num_threads) as executor:
+            group_rows = list(tqdm.tqdm(executor.map(
+                lambda src_dps: process_testres_group(
+                    my_args, src_dps, guides, model_notes, note_cache),
+                testres_groups), total=len(testres_groups), disable=hide_progress))
+
+    # Restore the original order of test result folders.
+    testres_rows = dict()
+    for (src_dps, cur_group_rows) in zip(testres_groups, group_rows):
+        testres_rows.update(zip(src_dps, cur_group_rows))
+    testres_rows = [testres_rows[src_dp] for src_dp in actual_testres_paths]
+
+    # Order summary rows by guide first, and then by test result folder.
+    summary_rows = [cur_rows[guide_idx] for guide_idx in range(len(guides))
+                    for cur_rows in testres_rows if cur_rows[guide_idx] is not None]
+
+    # Build the table only once at the end, since appending to a DataFrame copies it every time.
+    summary = pd.DataFrame(summary_rows)
 
     return summary
 
 
 def merge_cross_dataset_guides(
-        my_args, summary, actual_guide_paths, actual_testres_paths, model_notes):
+        my_args, summary, actual_guide_paths, actual_testres_paths, model_notes, note_cache):
+
+    if len(summary) == 0:
+        return summary
 
     # Merge cross-dataset guides as long as they are from the same model.
     # This typically adds extra lines to the automatic summary, but will not copy more videos.
-    new_summary = copy.deepcopy(summary)
+    new_summary_rows = summary.to_dict('records')
 
     model_pats = []
     for src_dp in actual_testres_paths:
@@ -235,15 +477,27 @@ def merge_cross_dataset_guides(
         model_pats.append('_'.join(src_dn.split('_')[0:2]))
     model_pats = list(set(model_pats))
 
+    # Derive the same model prefix for every existing summary row, such that row selection below
+    # becomes a vectorized equality test.
+    row_model_pats = summary['testres_dn'].str.split('_').str[0:2].str.join('_')
+
+    # List the output folder and all its subfolders once, instead of for every (guide, model) pair.
+    # NOTE: Cross-dataset folders created below are not revisited, since they only contain copies.
+    out_subdir_fns = dict()
+    for vid_dn in os.listdir(my_args.output_dir):
+        src_vid_dp = os.path.join(my_args.output_dir, vid_dn)
+        if os.path.isdir(src_vid_dp):
+            out_subdir_fns[vid_dn] = os.listdir(src_vid_dp)
+    video_suffixes = tuple([x.lower() for x in my_args.video_suffix])
+
     for cur_guide_fp in actual_guide_paths:
         guide_name = str(pathlib.Path(cur_guide_fp).name).split('.')[0]  # rdy_v2_m_nl
         dst_guide_name = 'cd_' + guide_name  # CD = cross dataset (typically markers *_m_*).
 
+        guide_mask = summary['guide'].eq(guide_name)
+
         for model_pat in model_pats:
-            sel_rows = pd.DataFrame()
-            for i, row in summary.iterrows():
-                if row['guide'] == guide_name and model_pat in row['testres_dn']:
-                    sel_rows = sel_rows.append(row, ignore_index=True)
+            sel_rows = summary[guide_mask & row_model_pats.eq(model_pat)]
 
             # NOTE / WARNING / DEBUG: We hardcoded rdy markers to be always cd here!
             if sel_rows.shape[0] == 0 or (not('_m_' in guide_name) and sel_rows.shape[0] <= 1):
@@ -258,34 +512,31 @@ def merge_cross_dataset_guides(
                             if ('count' in k and v > 0) or ('mean' in k and v > -1.0)}
 
             # Attach custom note if found.
-            note_dict = {'notes': ' '}
-            for testres_pat in model_notes.keys():
-                if testres_pat in model_pat:
-                    note_dict = {'notes': model_notes[testres_pat]}
-                    break
+            note_dict = {'notes': lookup_model_note(model_notes, note_cache, model_pat)}
 
             # Update summary.
-            new_summary = new_summary.append({
+            new_summary_rows.append({
                 'guide': dst_guide_name,
                 'testres_dn': model_pat,  # This is just a prefix in this case.
                 **note_dict,
                 # NOTE: num_examples is not kept track of anymore here.
                 **merged_metrics,
-            }, ignore_index=True)
+            })
 
             # Copy representative videos matching this (guide, model) pair.
             dst_vid_dp = os.path.join(my_args.output_dir, dst_guide_name + '_' + model_pat)
             os.makedirs(dst_vid_dp, exist_ok=True)
-            for vid_dn in os.listdir(my_args.output_dir):
+            for (vid_dn, vid_fns) in out_subdir_fns.items():
                 if '_' + guide_name in vid_dn and model_pat in vid_dn:
                     src_vid_dp = os.path.join(my_args.output_dir, vid_dn)
-                    for vid_fn in os.listdir(src_vid_dp):
-                        for suffix in my_args.video_suffix:
-                            if vid_fn.lower().endswith(suffix):
-                                src_vid_fp = os.path.join(src_vid_dp, vid_fn)
-                                dst_vid_fp = os.path.join(dst_vid_dp, vid_fn)
-                                if not(os.path.exists(dst_vid_fp)):
-                                    shutil.copyfile(src_vid_fp, dst_vid_fp)
+                    for vid_fn in vid_fns:
+                        if vid_fn.lower().endswith(video_suffixes):
+                            src_vid_fp = os.path.join(src_vid_dp, vid_fn)
+                            dst_vid_fp = os.path.join(dst_vid_dp, vid_fn)
+                            if not(os.path.exists(dst_vid_fp)):
+                                fast_copy(src_vid_fp, dst_vid_fp, my_args.link_videos)
+
+    new_summary = pd.DataFrame(new_summary_rows)
 
     return new_summary
 
@@ -119,10 +119,10 @@ class MyTrainPipeline(torch.nn.Module):
         # (B, 1, T, Hf, Wf).
         all_div_segm = kubric_retval['pv_div_segm_tf']
         # (B, M, T, Hf, Wf).
-        all_xyz = all_xyz.to(self.device)
-        all_rgb = all_rgb.to(self.device)
-        all_segm = all_segm.to(self.device)
-        all_div_segm = all_div_segm.to(self.device)
+        all_xyz = all_xyz.to(self.device, non_blocking=True)
+        all_rgb = all_rgb.to(self.device, non_blocking=True)
+        all_segm = all_segm.to(self.device, non_blocking=True)
+        all_div_segm = all_div_segm.to(self.device, non_blocking=True)
         inst_count = kubric_retval['pv_inst_count']
         # (B, 1); acts as Qt value per example.
         query_time = kubric_retval['traject_retval_tf']['query_time']
@@ -268,8 +268,8 @@ class MyTrainPipeline(torch.nn.Module):
         # Retrieve data.
         all_rgb = data_retval['pv_rgb_tf']  # (B, 3, T, Hf, Wf).
         all_segm = data_retval['pv_segm_tf']  # (B, 1, T, Hf, Wf).
-        all_rgb = all_rgb.to(self.device)
-        all_segm = all_segm.to(self.device)
+        all_rgb = all_rgb.to(self.device, non_blocking=True)
+        all_segm = all_segm.to(self.device, non_blocking=True)
         inst_count = data_retval['inst_count']  # (B); acts as Qt value per example.
         occl_risk = data_retval['occl_risk']  # (B, M, T, 2) with (percentage, increase).
         inst_area = data_retval['inst_area']  # (B, M, T) in [0, 1].
@@ -366,9 +366,9 @@ class MyTrainPipeline(torch.nn.Module):
         all_rgb = data_retval['pv_rgb_tf']  # (B, 3, T, Hf, Wf).
         all_query = data_retval['pv_query_tf']  # (B, 1, T, Hf, Wf).
         all_target = data_retval['pv_target_tf']  # (B, 3, T, Hf, Wf).
-        all_rgb = all_rgb.to(self.device)
-        all_query = all_query.to(self.device)
-        all_target = all_target.to(self.device)
+        all_rgb = all_rgb.to(self.device, non_blocking=True)
+        all_query = all_query.to(self.device, non_blocking=True)
+        all_target = all_target.to(self.device, non_blocking=True)
 
         (T, H, W) = all_rgb.shape[-3:]
         assert T == self.train_args.num_frames